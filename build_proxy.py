@@ -5,21 +5,23 @@ Recursively processes video files to create low-resolution proxy versions
 with random 5-second clips and metadata title cards.
 """
 
+import io
 import os
+import re
 import random
 import argparse
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, as_completed, wait
+from contextlib import redirect_stderr, redirect_stdout
 
 
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, Tuple
-
-try:
-    from moviepy.editor import VideoFileClip, TextClip, CompositeVideoClip
-    from moviepy.video.fx import resize
-except ImportError:
-    print("Error: MoviePy is required. Install with: pip install moviepy")
-    exit(1)
+from functools import lru_cache, partial
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
 
 try:
     from tqdm import tqdm
@@ -28,11 +30,10 @@ except ImportError:
     exit(1)
 
 try:
-    from PIL import Image, ExifTags
+    from PIL import Image, ImageDraw, ImageFont
 except ImportError:
-    print("Warning: Pillow not found. Date/location extraction will be limited.")
-    Image = None
-    ExifTags = None
+    print("Error: Pillow is required for title overlays. Install with: pip install Pillow")
+    exit(1)
 
 # Configuration constants
 SOURCE_DIRECTORY = "/testdata"
@@ -41,9 +42,125 @@ OUTPUT_DIRECTORY = "/video_clip_proxies"
 # Supported video formats
 VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mov', '.mkv', '.wmv', '.flv', '.webm', '.m4v', '.3gp'}
 
-def get_video_metadata(video_path: str) -> Tuple[Optional[str], Optional[str]]:
+# Parallelism: leave half the cores to ffmpeg's own encoder threads,
+# and stay within the concurrent session limit of consumer NVENC GPUs
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+DEFAULT_NVENC_SESSIONS = 3
+
+# Frame rate of clips encoded through a shared batch encoder (--batch-size)
+BATCH_FPS = 30
+
+# Clips of one file that fit in a window this long (seconds) share a decode;
+# clips further apart are each decoded from their own seek
+MAX_SHARED_DECODE_SPAN = 10
+
+# Futures kept in flight per worker, so the file walk is consumed lazily
+MAX_PENDING_PER_WORKER = 4
+
+# Known city names matched anywhere in a filename (e.g. "trip_paris_2021")
+CITY_PATTERN = re.compile(r'paris|london|tokyo|nyc|berlin', re.IGNORECASE)
+
+# Title overlay styling
+TITLE_FONT_FILE = "DejaVuSans.ttf"
+TITLE_FONT_SIZE = 20
+TITLE_STROKE_WIDTH = 2
+TITLE_MARGIN = 10
+
+def find_ffmpeg() -> str:
+    """
+    Locate ffmpeg: $FFMPEG_BINARY, the binary bundled with imageio-ffmpeg
+    (optional), or the one on PATH.
+    """
+    if os.environ.get("FFMPEG_BINARY", "ffmpeg-imageio") != "ffmpeg-imageio":
+        return os.environ["FFMPEG_BINARY"]
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return shutil.which("ffmpeg") or "ffmpeg"
+
+# ffmpeg binary used for all decoding, filtering, encoding and capability probes
+FFMPEG_BINARY = find_ffmpeg()
+
+# Duration line printed by 'ffmpeg -i' (e.g. "Duration: 00:01:23.45")
+DURATION_PATTERN = re.compile(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)')
+# First video stream line of 'ffmpeg -i': codec, pixel format, size, time base
+VIDEO_STREAM_PATTERN = re.compile(r'Stream #\S+: Video: (\w+)[^,]*, (\w+)(?:\([^)]*\))?, (\d+)x(\d+).*? ([\d.]+k?) tbn')
+# Rotation side data listed under a stream (e.g. "displaymatrix: rotation of -90.00 degrees")
+ROTATION_PATTERN = re.compile(r'displaymatrix: rotation of (-?[\d.]+) degrees')
+
+# Encoder settings: NVENC on the GPU when available, libx264 on the CPU otherwise.
+# Proxies are throwaway previews, so both default to their fastest preset.
+NVENC_CODEC = 'h264_nvenc'
+NVENC_PRESET = 'p1'
+NVENC_PARAMS = ['-tune', 'll', '-rc', 'vbr', '-cq', '28', '-b:v', '0']
+CPU_CODEC = 'libx264'
+CPU_PRESET = 'ultrafast'
+CPU_PARAMS = ['-tune', 'fastdecode', '-crf', '28']
+
+@lru_cache(maxsize=None)
+def nvenc_available() -> bool:
+    """
+    Check whether ffmpeg can encode with h264_nvenc on this host.
+    Runs a tiny test encode, since a build may list the encoder without a usable GPU.
+    """
+    cmd = [
+        FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', 'color=black:size=256x256:duration=0.1',
+        '-c:v', NVENC_CODEC, '-f', 'null', '-'
+    ]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return result.returncode == 0
+
+@lru_cache(maxsize=None)
+def nvdec_available() -> bool:
+    """
+    Check whether ffmpeg supports the CUDA hwaccel and can open a CUDA device.
+    """
+    try:
+        hwaccels = subprocess.run([FFMPEG_BINARY, '-hide_banner', '-hwaccels'],
+                                  capture_output=True, text=True, timeout=30)
+        if 'cuda' not in hwaccels.stdout.split():
+            return False
+        device = subprocess.run([
+            FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error',
+            '-init_hw_device', 'cuda=gpu', '-f', 'lavfi', '-i', 'nullsrc=duration=0.1',
+            '-f', 'null', '-'
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return device.returncode == 0
+
+@lru_cache(maxsize=None)
+def drawtext_available() -> bool:
+    """
+    Check whether ffmpeg was built with the drawtext filter (it needs libfreetype).
+    """
+    try:
+        result = subprocess.run([FFMPEG_BINARY, '-hide_banner', '-filters'],
+                                capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return any(line.split()[1:2] == ['drawtext'] for line in result.stdout.splitlines())
+
+def get_encoder_settings(preset: Optional[str] = None) -> Tuple[str, list]:
+    """
+    Return (codec, ffmpeg_params) for the video encoder, preferring NVENC.
+    preset overrides the encoder's default (fastest) preset.
+    """
+    if nvenc_available():
+        return NVENC_CODEC, ['-preset', preset or NVENC_PRESET, *NVENC_PARAMS]
+    return CPU_CODEC, ['-preset', preset or CPU_PRESET, *CPU_PARAMS]
+
+def get_video_metadata(video_path: str, mtime: Optional[float] = None,
+                       stem: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
     """
     Extract date and location metadata from video file.
+    Pass mtime when it is already known (e.g. from find_video_files) to skip the stat call,
+    and stem when the caller has already split the file name.
     Returns (date_str, location_str) tuple.
     """
     date_str = None
@@ -51,8 +168,9 @@ def get_video_metadata(video_path: str) -> Tuple[Optional[str], Optional[str]]:
     
     try:
         # Try to get file creation/modification date as fallback
-        stat = os.stat(video_path)
-        mod_time = datetime.fromtimestamp(stat.st_mtime)
+        if mtime is None:
+            mtime = os.stat(video_path).st_mtime
+        mod_time = datetime.fromtimestamp(mtime)
         date_str = mod_time.strftime("%Y-%m-%d %H:%M")
         
         # For more advanced metadata extraction, you might want to use:
@@ -61,36 +179,285 @@ def get_video_metadata(video_path: str) -> Tuple[Optional[str], Optional[str]]:
         # - mediainfo-python for comprehensive media information
         
         # Basic filename-based location extraction (if filename contains location info)
-        filename = Path(video_path).stem
+        filename = stem if stem is not None else Path(video_path).stem
         # This is a simple example - you might want to implement more sophisticated parsing
-        if any(keyword in filename.lower() for keyword in ['paris', 'london', 'tokyo', 'nyc', 'berlin']):
-            for city in ['paris', 'london', 'tokyo', 'nyc', 'berlin']:
-                if city in filename.lower():
-                    location_str = city.title()
-                    break
+        city_match = CITY_PATTERN.search(filename)
+        if city_match:
+            location_str = city_match.group(0).title()
     
     except Exception as e:
-        print(f"Warning: Could not extract metadata from {video_path}: {e}")
+        tqdm.write(f"Warning: Could not extract metadata from {video_path}: {e}")
     
     return date_str, location_str
 
-def create_title_overlay(text: str, duration: float, size: Tuple[int, int] = (640, 360)) -> TextClip:
+@lru_cache(maxsize=None)
+def get_title_font() -> ImageFont.ImageFont:
+    """
+    Load the title font once per process, falling back to PIL's built-in font.
+    """
+    try:
+        return ImageFont.truetype(TITLE_FONT_FILE, TITLE_FONT_SIZE)
+    except OSError:
+        return ImageFont.load_default()
+
+def render_title_image(text: str) -> Image.Image:
     """
-    Create a text overlay with the given text.
+    Rasterize the title text into a transparent RGBA image sized to fit it.
     """
-    title_overlay = TextClip(
+    font = get_title_font()
+    left, top, right, bottom = ImageDraw.Draw(Image.new('RGBA', (1, 1))).multiline_textbbox(
+        (0, 0), text, font=font, stroke_width=TITLE_STROKE_WIDTH
+    )
+    
+    image = Image.new(
+        'RGBA',
+        (right - left + 2 * TITLE_MARGIN, bottom - top + 2 * TITLE_MARGIN),
+        (0, 0, 0, 0)
+    )
+    ImageDraw.Draw(image).multiline_text(
+        (TITLE_MARGIN - left, TITLE_MARGIN - top),
         text,
-        fontsize=20,
-        color='white',
-        stroke_color='black',
-        stroke_width=2,
-        method='caption',
-        align='left'
-    ).set_duration(duration).set_position(('left', 'top')).set_margin(10)
+        font=font,
+        fill='white',
+        stroke_width=TITLE_STROKE_WIDTH,
+        stroke_fill='black'
+    )
+    
+    return image
+
+@lru_cache(maxsize=None)
+def find_ffprobe() -> Optional[str]:
+    """
+    Locate ffprobe: $FFPROBE_BINARY, next to the ffmpeg binary, or on PATH.
+    Returns None when it cannot be found (e.g. with the imageio-ffmpeg build).
+    """
+    candidates = [
+        os.environ.get("FFPROBE_BINARY"),
+        os.path.join(os.path.dirname(FFMPEG_BINARY), os.path.basename(FFMPEG_BINARY).replace("ffmpeg", "ffprobe")),
+        shutil.which("ffprobe")
+    ]
+    for candidate in candidates:
+        if candidate and os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return candidate
+    return None
+
+def probe_video(input_path: str) -> Tuple[float, Optional[tuple]]:
+    """
+    Read a video's duration in seconds and a key describing its first video
+    stream (codec, pixel format, size, time base and display rotation) from
+    the container header.
+    Uses ffprobe when available, otherwise parses 'ffmpeg -i' output;
+    neither starts a decoder. The stream key is None if it cannot be read.
+    """
+    ffprobe = find_ffprobe()
+    if ffprobe:
+        result = subprocess.run([
+            ffprobe, '-v', 'error', '-select_streams', 'v:0',
+            '-show_entries', 'format=duration:stream=codec_name,pix_fmt,width,height,time_base:stream_side_data=rotation',
+            '-of', 'default=noprint_wrappers=1', input_path
+        ], capture_output=True, text=True)
+        fields = dict(line.split('=', 1) for line in result.stdout.splitlines() if '=' in line)
+        try:
+            duration = float(fields.get('duration', ''))
+        except ValueError:
+            # No container duration (e.g. "N/A"); let ffmpeg estimate it below
+            pass
+        else:
+            stream = [fields.get(key) for key in ('codec_name', 'pix_fmt', 'width', 'height', 'time_base')]
+            rotation = float(fields.get('rotation', 0))
+            return duration, (*stream, rotation) if all(stream) else None
+    
+    result = subprocess.run([FFMPEG_BINARY, '-hide_banner', '-i', input_path],
+                            capture_output=True, text=True)
+    match = DURATION_PATTERN.search(result.stderr)
+    if not match:
+        lines = result.stderr.strip().splitlines()
+        raise RuntimeError(f"Could not read duration: {lines[-1] if lines else 'no ffmpeg output'}")
+    
+    hours, minutes, seconds = match.groups()
+    duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    stream = VIDEO_STREAM_PATTERN.search(result.stderr)
+    if not stream:
+        return duration, None
     
-    return title_overlay
+    # Side data is listed below the stream line, before the next stream
+    side_data = result.stderr[stream.end():].split('Stream #', 1)[0]
+    rotation = ROTATION_PATTERN.search(side_data)
+    rotation = float(rotation.group(1)) if rotation else 0.0
+    return duration, (*stream.groups(), rotation)
 
-def process_video_file(input_path: str, output_dir: str, target_width: int = 640, pbar: Optional[tqdm] = None) -> bool:
+def pick_start_times(input_path: str, duration: float, count: int = 1) -> List[float]:
+    """
+    Select count random 5-second sequences, seeded by path so runs are reproducible
+    and parallel workers never share the global RNG. Returned in ascending order.
+    """
+    max_start_time = duration - 5
+    rng = random.Random(input_path)
+    return sorted(rng.uniform(0, max_start_time) for _ in range(count))
+
+def proxy_output_paths(output_dir: str, input_path: str, count: int = 1,
+                       stem: Optional[str] = None) -> List[str]:
+    """
+    Name the proxy files for an input: {stem}_proxy.mp4, or numbered when
+    several clips are taken from the same video.
+    """
+    filename = stem if stem is not None else Path(input_path).stem
+    if count == 1:
+        return [os.path.join(output_dir, f"{filename}_proxy.mp4")]
+    return [os.path.join(output_dir, f"{filename}_proxy_{i + 1:02d}.mp4") for i in range(count)]
+
+def build_title_text(input_path: str, mtime: Optional[float] = None, stem: Optional[str] = None) -> str:
+    """
+    Build the title card text from the file's metadata.
+    """
+    if stem is None:
+        stem = Path(input_path).stem
+    date_str, location_str = get_video_metadata(input_path, mtime, stem)
+    
+    title_parts = []
+    if date_str:
+        title_parts.append(f"Date: {date_str}")
+    if location_str:
+        title_parts.append(f"Location: {location_str}")
+    
+    title_parts.append(f"File: {stem}")
+    
+    return "\n".join(title_parts) if title_parts else f"File: {stem}"
+
+def escape_filter_value(value: str) -> str:
+    """
+    Escape a filter option value (e.g. a file path) for embedding in a filter graph.
+    ffmpeg unescapes twice: once for the option list, once for the graph.
+    """
+    for special in ("\\':", "\\'[],;"):
+        value = ''.join('\\' + char if char in special else char for char in value)
+    return value
+
+def title_filter(title_text: str, work_dir: str, gpu_frames: bool = False, name: str = "title",
+                 input_index: int = 1, enable: Optional[str] = None,
+                 source: str = "base", sink: str = "out") -> Tuple[List[str], str]:
+    """
+    Prepare the title for a filter graph whose scaled video is labelled [source].
+    
+    Uses ffmpeg's drawtext filter when the build has it, so the text is drawn
+    in C on each frame with no image input. Otherwise (and for CUDA frames,
+    which drawtext cannot touch) a PIL-rendered PNG is overlaid instead, read
+    as ffmpeg input number input_index. Files needed by the filter are written
+    to work_dir under the given name. An enable expression limits the title to
+    part of the timeline, so several titles can share one stream.
+    
+    Returns (extra ffmpeg input arguments, filter chain producing [sink]).
+    """
+    timeline = [f"enable={escape_filter_value(enable)}"] if enable else []
+    
+    if not gpu_frames and drawtext_available():
+        text_path = os.path.join(work_dir, f"{name}.txt")
+        with open(text_path, 'w', encoding='utf-8') as text_file:
+            text_file.write(title_text)
+        
+        options = [
+            f"textfile={escape_filter_value(text_path)}",
+            "expansion=none",
+            f"x={TITLE_MARGIN}", f"y={TITLE_MARGIN}",
+            f"fontsize={TITLE_FONT_SIZE}", "fontcolor=white",
+            f"borderw={TITLE_STROKE_WIDTH}", "bordercolor=black"
+        ]
+        # PIL's built-in fallback font has no file on disk; drawtext then uses its default
+        font_path = getattr(get_title_font(), 'path', None)
+        if isinstance(font_path, str):
+            options.append(f"fontfile={escape_filter_value(font_path)}")
+        
+        return [], f"[{source}]drawtext={':'.join(options + timeline)}[{sink}]"
+    
+    overlay_path = os.path.join(work_dir, f"{name}.png")
+    render_title_image(title_text).save(overlay_path)
+    
+    if gpu_frames:
+        return ['-i', overlay_path], (
+            f"[{input_index}:v]format=yuva420p,hwupload_cuda[{name}];"
+            f"[{source}][{name}]overlay_cuda={':'.join(['x=0', 'y=0'] + timeline)}[{sink}]"
+        )
+    return ['-i', overlay_path], (
+        f"[{source}][{input_index}:v]overlay={':'.join(['x=0', 'y=0', 'format=yuv420'] + timeline)}[{sink}]"
+    )
+
+def transcode_clips(input_path: str, output_paths: List[str], start_times: List[float], target_width: int,
+                    title_text: str, work_dir: str, gpu_frames: bool, audio: bool = False,
+                    preset: Optional[str] = None) -> Optional[str]:
+    """
+    Cut, resize, title and encode 5-second clips of one file in a single ffmpeg process,
+    keeping frames on the GPU end to end when gpu_frames is set.
+    Returns None on success, or ffmpeg's error output on failure.
+    """
+    cmd = [FFMPEG_BINARY, '-y', '-hide_banner', '-loglevel', 'error']
+    
+    # Decoder options are per input, so they are repeated before each -i.
+    # Scaling also converts to 8-bit yuv420p, so the title and encoder never
+    # see RGB or high-bit-depth frames (overlay_cuda needs a yuv420p base)
+    if gpu_frames:
+        cmd += ['-init_hw_device', 'cuda=gpu', '-filter_hw_device', 'gpu']
+        decode_args = ['-hwaccel', 'cuda', '-hwaccel_device', 'gpu', '-hwaccel_output_format', 'cuda']
+        scale_filter = f"scale_cuda={target_width}:-2:format=yuv420p"
+    else:
+        decode_args = ['-hwaccel', 'cuda'] if nvdec_available() else []
+        scale_filter = f"scale={target_width}:-2,format=yuv420p"
+    codec, codec_params = get_encoder_settings(preset)
+    
+    # Group the (sorted) clips into decode windows: [(seek, [(output path, start time)])].
+    # Nearby clips share one decode split into several outputs; clips further
+    # apart each get their own input, so the gap between them is never decoded
+    windows = []
+    for output_path, start_time in zip(output_paths, start_times):
+        if windows and start_time + 5 - windows[-1][0] <= MAX_SHARED_DECODE_SPAN:
+            windows[-1][1].append((output_path, start_time))
+        else:
+            windows.append((start_time, [(output_path, start_time)]))
+    
+    title_inputs = []
+    filter_chains = []
+    outputs = []
+    for index, (seek, clips) in enumerate(windows):
+        span = clips[-1][1] + 5 - seek
+        # Seeking before -i jumps to the nearest keyframe; the re-encode still trims exactly
+        cmd += [*decode_args, '-ss', f"{seek:.3f}", '-t', f"{span:.3f}", '-i', input_path]
+        
+        inputs, title_chain = title_filter(title_text, work_dir, gpu_frames, name=f"title{index}",
+                                           input_index=len(windows) + len(title_inputs) // 2,
+                                           source=f"base{index}", sink=f"out{index}")
+        title_inputs += inputs
+        filter_chains += [f"[{index}:v]{scale_filter}[base{index}]", title_chain]
+        
+        if len(clips) == 1:
+            labels = [f"[out{index}]"]
+        else:
+            labels = [f"[out{index}_{i}]" for i in range(len(clips))]
+            filter_chains.append(f"[out{index}]split={len(clips)}" + ''.join(labels))
+        for label, (output_path, start_time) in zip(labels, clips):
+            outputs.append((label, index, output_path, start_time - seek))
+    
+    cmd += [*title_inputs, '-filter_complex', ';'.join(filter_chains)]
+    for label, index, output_path, offset in outputs:
+        # Audio is only decoded and encoded when requested
+        audio_args = ['-map', f"{index}:a?", '-c:a', 'aac'] if audio else ['-an']
+        cmd += [
+            '-map', label, *audio_args,
+            '-ss', f"{offset:.3f}", '-t', '5',
+            '-c:v', codec, *codec_params,
+            output_path
+        ]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        return result.stderr.strip() or f"ffmpeg exited with status {result.returncode}"
+    return None
+
+# (codec, pixel format) pairs for which the GPU-only pipeline failed in this
+# worker where CPU filters worked (e.g. formats NVDEC cannot decode); later
+# files in those formats skip straight to the CPU filters
+gpu_frames_failed_formats = set()
+
+def process_video_file(input_path: str, output_dir: str, target_width: int = 640,
+                       mtime: Optional[float] = None, clips_per_video: int = 1, audio: bool = False,
+                       preset: Optional[str] = None, max_encoders: Optional[int] = None) -> bool:
     """
     Process a single video file to create a proxy version.
     
@@ -98,115 +465,280 @@ def process_video_file(input_path: str, output_dir: str, target_width: int = 640
         input_path: Path to input video file
         output_dir: Directory to save proxy version
         target_width: Target width for low-res version
-        pbar: Optional progress bar for updates
+        mtime: Cached modification time of the input, if already known
+        clips_per_video: Number of random 5-second clips to extract
+        audio: Keep the audio track (re-encoded as AAC)
+        preset: Encoder preset, overriding the fastest-preset default
+        max_encoders: Most clips (encoder sessions) per ffmpeg process; more
+            clips are encoded in several runs, one after another
     
     Returns:
         True if successful, False otherwise
     """
+    # Split the file name once; it is used for the title, output names and messages
+    path = Path(input_path)
+    name, stem = path.name, path.stem
+    
     try:
-        if pbar:
-            pbar.set_description(f"Processing: {Path(input_path).name}")
+        duration, stream_key = probe_video(input_path)
         
-        # Load video clip
-        with VideoFileClip(input_path) as video:
-            duration = video.duration
-            
-            # Skip videos shorter than 5 seconds
-            if duration < 5:
-                if pbar:
-                    pbar.write(f"Skipping {Path(input_path).name}: duration {duration:.1f}s < 5s")
-                return False
-            
-            # Select random 5-second sequence
-            max_start_time = duration - 5
-            start_time = random.uniform(0, max_start_time)
-            end_time = start_time + 5
-            
-            if pbar:
-                pbar.set_description(f"Extracting clip: {Path(input_path).name}")
-            
-            # Extract 5-second clip
-            clip = video.subclip(start_time, end_time)
-            
-            # Create low-resolution version
-            # Calculate target height maintaining aspect ratio
-            original_width, original_height = clip.size
-            target_height = int((target_width / original_width) * original_height)
-            
-            # Resize to low resolution
-            low_res_clip = resize(clip, width=target_width)
-            
-            # Extract metadata
-            date_str, location_str = get_video_metadata(input_path)
-            
-            # Create title card text
-            title_parts = []
-            if date_str:
-                title_parts.append(f"Date: {date_str}")
-            if location_str:
-                title_parts.append(f"Location: {location_str}")
-            
-            filename = Path(input_path).stem
-            title_parts.append(f"File: {filename}")
-            
-            title_text = "\n".join(title_parts) if title_parts else f"File: {filename}"
-            
-            # Create title overlay
-            title_overlay = create_title_overlay(
-                title_text, 
-                duration=5.0
-            )
-            
-            # Combine video clip with text overlay
-            final_clip = CompositeVideoClip([
-                low_res_clip,
-                title_overlay
-            ], size=(target_width, target_height))
-            
-            # Keep original 5-second duration
-            final_clip = final_clip.set_duration(5.0)
-            
-            # Generate output filename
-            output_filename = f"{filename}_proxy.mp4"
-            output_path = os.path.join(output_dir, output_filename)
-            
-            if pbar:
-                pbar.set_description(f"Rendering: {Path(input_path).name}")
-            
-            # Write the final video
-            final_clip.write_videofile(
-                output_path,
-                codec='libx264',
-                audio_codec='aac',
-                temp_audiofile='temp-audio.m4a',
-                remove_temp=True,
-                verbose=False,
-                logger=None
-            )
-            
-            if pbar:
-                pbar.write(f"✓ Successfully created 5s proxy for {filename}")
-            return True
+        # Skip videos shorter than 5 seconds
+        if duration < 5:
+            tqdm.write(f"Skipping {name}: duration {duration:.1f}s < 5s")
+            return False
+        
+        start_times = pick_start_times(input_path, duration, clips_per_video)
+        
+        title_text = build_title_text(input_path, mtime, stem)
+        
+        # Generate output filenames
+        output_paths = proxy_output_paths(output_dir, input_path, clips_per_video, stem)
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Keep frames on the GPU end to end when both NVDEC and NVENC are usable
+            source_format = stream_key[:2] if stream_key else None
+            gpu_frames = (source_format not in gpu_frames_failed_formats
+                          and nvdec_available() and nvenc_available())
+            step = max_encoders or len(output_paths)
+            for first in range(0, len(output_paths), step):
+                run_paths = output_paths[first:first + step]
+                run_starts = start_times[first:first + step]
+                error = transcode_clips(input_path, run_paths, run_starts, target_width,
+                                        title_text, tmp_dir, gpu_frames, audio, preset)
+                
+                if error and gpu_frames:
+                    tqdm.write(f"GPU transcode failed for {name}, retrying with CPU filters: {error}")
+                    error = transcode_clips(input_path, run_paths, run_starts, target_width,
+                                            title_text, tmp_dir, False, audio, preset)
+                    if not error:
+                        gpu_frames_failed_formats.add(source_format)
+                        gpu_frames = False
+                
+                if error:
+                    break
+        
+        if error:
+            raise RuntimeError(error)
+        
+        clip_count = f"{len(output_paths)} x " if len(output_paths) > 1 else ""
+        tqdm.write(f"✓ Successfully created {clip_count}5s proxy for {stem}")
+        return True
             
     except Exception as e:
-        if pbar:
-            pbar.write(f"✗ Error processing {Path(input_path).name}: {e}")
-        else:
-            print(f"✗ Error processing {input_path}: {e}")
+        tqdm.write(f"✗ Error processing {input_path}: {e}")
         return False
 
-def find_video_files(directory: str) -> list:
+def process_video_files(video_files: List[Tuple[str, float]], output_dir: str,
+                        target_width: int = 640, clips_per_video: int = 1, audio: bool = False,
+                        preset: Optional[str] = None, max_encoders: Optional[int] = None) -> List[bool]:
+    """
+    Process each (path, mtime) pair with its own ffmpeg process.
+    Returns one success flag per input file.
+    """
+    return [
+        process_video_file(input_path, output_dir, target_width, mtime, clips_per_video, audio,
+                           preset, max_encoders)
+        for input_path, mtime in video_files
+    ]
+
+def ffconcat_quote(path: str) -> str:
+    """
+    Quote a file path for an ffconcat list (relative paths would resolve
+    against the list's own directory, so the path is made absolute).
+    """
+    return "'" + os.path.abspath(path).replace("'", "'\\''") + "'"
+
+def encode_concat_clips(clips: List[Tuple[str, float, str]], segment_dir: str,
+                        frame_width: int, frame_height: int, preset: Optional[str] = None) -> Optional[str]:
+    """
+    Encode (input path, start time, title text) clips of same-format files in a single
+    ffmpeg process, writing one segment_NNNNN.mp4 per clip into segment_dir.
+    Returns None on success, or ffmpeg's error output on failure.
+    """
+    # Clip k fills [5k, 5k + 5) of the concat demuxer's timeline. The demuxer
+    # applies the first file's stream properties to every entry, so callers
+    # must group files by codec, pixel format, size, time base and rotation
+    list_path = os.path.join(segment_dir, "inputs.ffconcat")
+    segment_list_path = os.path.join(segment_dir, "segments.csv")
+    with open(list_path, 'w', encoding='utf-8') as list_file:
+        list_file.write("ffconcat version 1.0\n")
+        for input_path, start_time, _ in clips:
+            list_file.write(
+                f"file {ffconcat_quote(input_path)}\n"
+                f"inpoint {start_time:.3f}\n"
+                f"outpoint {start_time + 5:.3f}\n"
+                "duration 5\n"
+            )
+    
+    # A clip's first frame usually arrives a little after its 5-second slot
+    # starts; pin it to the slot start, or fps would fill the gap by repeating
+    # the previous clip's last frame (round=down keeps every frame in its slot)
+    snap_to_slot = "if(gt(floor(T/5),floor(PREV_INT/5)),floor(T/5)*5/TB,PTS)"
+    filter_graph = (
+        f"[0:v]select=concatdec_select,setpts={escape_filter_value(snap_to_slot)},"
+        f"fps={BATCH_FPS}:start_time=0:round=down,"
+        f"scale={frame_width}:{frame_height}:force_original_aspect_ratio=decrease,format=yuv420p,"
+        f"pad={frame_width}:{frame_height}:(ow-iw)/2:(oh-ih)/2,setsar=1[title0]"
+    )
+    # Each title is only enabled during its own clip
+    title_inputs = []
+    for index, (_, _, title_text) in enumerate(clips):
+        sink = "out" if index == len(clips) - 1 else f"title{index + 1}"
+        inputs, chain = title_filter(title_text, segment_dir, name=f"title{index}",
+                                     input_index=1 + len(title_inputs) // 2,
+                                     enable=f"gte(t,{index * 5})*lt(t,{index * 5 + 5})",
+                                     source=f"title{index}", sink=sink)
+        title_inputs += inputs
+        filter_graph += ";" + chain
+    
+    codec, codec_params = get_encoder_settings(preset)
+    cmd = [FFMPEG_BINARY, '-y', '-hide_banner', '-loglevel', 'error']
+    if nvdec_available():
+        cmd += ['-hwaccel', 'cuda']
+    # -copyts keeps clips on their slots; segment_time_metadata tags frames with
+    # their entry's window, so concatdec_select drops the keyframe pre-roll
+    # before each inpoint and B-frames that run past each outpoint
+    cmd += [
+        '-copyts', '-f', 'concat', '-safe', '0', '-segment_time_metadata', '1', '-i', list_path,
+        *title_inputs,
+        '-filter_complex', filter_graph,
+        '-map', '[out]', '-an', '-t', str(len(clips) * 5),
+        '-c:v', codec, *codec_params,
+        '-force_key_frames', 'expr:gte(t,n_forced*5)',
+        '-f', 'segment', '-segment_time', '5', '-segment_time_delta', f"{0.5 / BATCH_FPS:.4f}",
+        '-reset_timestamps', '1',
+        '-segment_list', segment_list_path, '-segment_list_type', 'csv',
+        os.path.join(segment_dir, 'segment_%05d.mp4')
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        return result.stderr.strip() or f"ffmpeg exited with status {result.returncode}"
+    
+    # Each segment must start on its clip's slot, or it would open with another clip's frames
+    with open(segment_list_path, encoding='utf-8') as segment_list:
+        segment_starts = [float(line.rsplit(',', 2)[1]) for line in segment_list if line.strip()]
+    if len(segment_starts) != len(clips):
+        return f"segment muxer wrote {len(segment_starts)} segments for {len(clips)} clips"
+    for index, segment_start in enumerate(segment_starts):
+        if abs(segment_start - index * 5) > 0.5 / BATCH_FPS:
+            return f"segment {index} starts at {segment_start:.3f}s instead of {index * 5}s"
+    return None
+
+def process_video_batch(video_files: List[Tuple[str, float]], output_dir: str,
+                        target_width: int = 640, clips_per_video: int = 1,
+                        preset: Optional[str] = None, max_encoders: Optional[int] = None) -> List[bool]:
+    """
+    Process a batch of (path, mtime) pairs with one ffmpeg process per stream format
+    (fixed 16:9 letterboxed frame, BATCH_FPS, no audio).
+    Returns one success flag per input file.
+    """
+    results = [False] * len(video_files)
+    frame_width = target_width
+    frame_height = int(target_width * 9 / 16) // 2 * 2
+    
+    # stream key -> [(index into video_files, path, stem, mtime, start times, title text, output paths)]
+    groups = {}
+    for index, (input_path, mtime) in enumerate(video_files):
+        path = Path(input_path)
+        try:
+            duration, stream_key = probe_video(input_path)
+            if duration < 5:
+                tqdm.write(f"Skipping {path.name}: duration {duration:.1f}s < 5s")
+                continue
+            
+            start_times = pick_start_times(input_path, duration, clips_per_video)
+            title_text = build_title_text(input_path, mtime, path.stem)
+            output_paths = proxy_output_paths(output_dir, input_path, clips_per_video, path.stem)
+        except Exception as e:
+            tqdm.write(f"✗ Error processing {input_path}: {e}")
+            continue
+        
+        # A file whose stream could not be identified is concatenated with nothing else
+        groups.setdefault(stream_key or input_path, []).append(
+            (index, input_path, path.stem, mtime, start_times, title_text, output_paths))
+    
+    for group in groups.values():
+        clips = [(input_path, start_time, title_text)
+                 for _, input_path, _, _, start_times, title_text, _ in group
+                 for start_time in start_times]
+        
+        # One encoder start-up (and NVENC session) per group; segments are renamed to the proxy names
+        with tempfile.TemporaryDirectory(dir=output_dir, prefix='.batch-') as segment_dir:
+            error = encode_concat_clips(clips, segment_dir, frame_width, frame_height, preset)
+            if error is None:
+                segments = (os.path.join(segment_dir, f"segment_{i:05d}.mp4") for i in range(len(clips)))
+                for index, _, stem, _, _, _, output_paths in group:
+                    for output_path in output_paths:
+                        os.replace(next(segments), output_path)
+                    results[index] = True
+                    clip_count = f"{len(output_paths)} x " if len(output_paths) > 1 else ""
+                    tqdm.write(f"✓ Successfully created {clip_count}5s proxy for {stem}")
+        
+        # Fall back to per-file encoding, still within the encoder session cap
+        if error:
+            tqdm.write(f"Batch encode failed for {len(group)} file(s), processing them one by one: {error}")
+            for index, input_path, _, mtime, _, _, _ in group:
+                results[index] = process_video_file(input_path, output_dir, target_width, mtime,
+                                                    clips_per_video, preset=preset, max_encoders=max_encoders)
+    
+    return results
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """
+    Group an iterable into lists of at most size items, consuming it lazily.
+    """
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def find_video_files(directory: str) -> Iterator[Tuple[str, float]]:
     """
     Recursively find all video files in directory.
+    Yields (path, mtime) tuples, reusing the stat result os.scandir already holds.
+    """
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        yield from find_video_files(entry.path)
+                    elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in VIDEO_EXTENSIONS:
+                        yield entry.path, entry.stat().st_mtime
+                except OSError:
+                    continue
+    except OSError:
+        return
+
+def run_task(worker: Callable[..., List[bool]], *args) -> Tuple[List[bool], str]:
     """
-    video_files = []
+    Run a worker task and return its results with the messages it wrote,
+    for the main process to print above its progress bar.
+    """
+    # A forked worker holds a stale copy of the bar; with stderr redirected
+    # too, tqdm.write no longer clears and redraws that copy
+    output = io.StringIO()
+    with redirect_stdout(output), redirect_stderr(output):
+        results = worker(*args)
+    return results, output.getvalue()
+
+def iter_completed(futures: Iterable[Future], max_pending: int) -> Iterator[Future]:
+    """
+    Yield futures as they complete while pulling new ones from a lazy iterable.
+    At most max_pending futures are in flight, so submission (and whatever
+    generator feeds it) only runs ahead of the workers by a bounded amount.
+    """
+    pending = set()
     
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if Path(file).suffix.lower() in VIDEO_EXTENSIONS:
-                video_files.append(os.path.join(root, file))
+    for future in futures:
+        if len(pending) >= max_pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            yield from done
+        pending.add(future)
     
-    return video_files
+    yield from as_completed(pending)
 
 def main():
     parser = argparse.ArgumentParser(description='Create proxy versions of video files')
@@ -214,6 +746,19 @@ def main():
                        help='Target width for proxy videos (default: 640)')
     parser.add_argument('--dry-run', action='store_true',
                        help='List files that would be processed without processing them')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                       help=f'Number of videos to process in parallel (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--nvenc-sessions', type=int, default=DEFAULT_NVENC_SESSIONS,
+                       help=f'Maximum parallel workers when encoding with NVENC (default: {DEFAULT_NVENC_SESSIONS})')
+    parser.add_argument('--clips-per-video', type=int, default=1,
+                       help='Number of random 5-second clips to extract from each video (default: 1)')
+    parser.add_argument('--audio', action=argparse.BooleanOptionalAction, default=False,
+                       help='Keep the audio track in proxies (default: --no-audio)')
+    parser.add_argument('--preset',
+                       help=f'Encoder preset (default: {NVENC_PRESET} for NVENC, {CPU_PRESET} for libx264)')
+    parser.add_argument('--batch-size', type=int, default=0,
+                       help='Encode N files per task through one ffmpeg concat/segment run '
+                            '(fixed 16:9 frame, 30 fps, no audio); 0 encodes each file separately (default: 0)')
     parser.add_argument('--source-dir', default=SOURCE_DIRECTORY,
                        help=f'Override source directory (default: {SOURCE_DIRECTORY})')
     parser.add_argument('--output-dir', default=OUTPUT_DIRECTORY,
@@ -234,33 +779,71 @@ def main():
     if not args.dry_run:
         os.makedirs(output_dir, exist_ok=True)
     
-    # Find all video files
+    # Find video files lazily; the walk overlaps with processing
     print(f"Searching for video files in: {input_dir}")
     video_files = find_video_files(input_dir)
     
-    if not video_files:
-        print("No video files found.")
-        return 0
-    
-    print(f"Found {len(video_files)} video files")
-    
     if args.dry_run:
         print("\nFiles that would be processed:")
-        for video_file in video_files:
+        found = 0
+        for video_file, _ in video_files:
             print(f"  {video_file}")
+            found += 1
+        print(f"\nFound {found} video files" if found else "No video files found.")
         return 0
     
-    # Process each video file with progress bar
+    # Detect hardware decoding/encoding support once up front
+    if nvdec_available():
+        print("Using NVDEC hardware decoding (cuda)")
+    else:
+        print("NVDEC not available, decoding on the CPU")
+    if nvenc_available():
+        print(f"Using NVENC hardware encoding ({NVENC_CODEC})")
+    else:
+        print(f"NVENC not available, falling back to {CPU_CODEC}")
+    
+    clips_per_video = max(1, args.clips_per_video)
+    max_workers = max(1, args.workers)
+    max_encoders = None
+    if nvenc_available():
+        # Each worker opens one NVENC session per clip it encodes concurrently;
+        # a file with more clips than sessions is encoded in several runs
+        nvenc_sessions = max(1, args.nvenc_sessions)
+        max_encoders = 1 if args.batch_size > 0 else min(clips_per_video, nvenc_sessions)
+        max_workers = min(max_workers, nvenc_sessions // max_encoders)
+    print(f"Processing with {max_workers} parallel workers")
+    
+    # Process video files in parallel, updating the progress bar as each finishes
     successful = 0
     failed = 0
     
-    with tqdm(total=len(video_files), desc="Processing videos", unit="video") as pbar:
-        for video_file in video_files:
-            if process_video_file(video_file, output_dir, args.width, pbar):
-                successful += 1
-            else:
-                failed += 1
-            pbar.update(1)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # Each task handles a list of files: one at a time, or a shared-encoder batch
+        if args.batch_size > 0:
+            if args.audio:
+                print("Note: --batch-size output has no audio; ignoring --audio")
+            worker, batch_size = partial(process_video_batch, preset=args.preset,
+                                         max_encoders=max_encoders), args.batch_size
+        else:
+            worker, batch_size = partial(process_video_files, audio=args.audio, preset=args.preset,
+                                         max_encoders=max_encoders), 1
+        
+        futures = (
+            executor.submit(run_task, worker, batch, output_dir, args.width, clips_per_video)
+            for batch in batched(video_files, batch_size)
+        )
+        with tqdm(desc="Processing videos", unit="video") as pbar:
+            for future in iter_completed(futures, max_workers * MAX_PENDING_PER_WORKER):
+                results, messages = future.result()
+                if messages:
+                    tqdm.write(messages, end='')
+                successful += sum(results)
+                failed += len(results) - sum(results)
+                pbar.update(len(results))
+    
+    if successful + failed == 0:
+        print("No video files found.")
+        return 0
     
     print(f"\nProcessing complete:")
     print(f"  ✓ Successful: {successful}")